@@ -3,8 +3,6 @@ GPT integration for code understanding and responses.
 """
 
 import os
-import openai
-from dotenv import load_dotenv
 from typing import Dict, Any, Optional
 import sys
 import json
@@ -12,12 +10,10 @@ import json
 # Add the parent directory to the path so we can import from scripts
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.retriever import get_context_for_query
+from scripts._openai_client import get_client
 
-# Load environment variables
-load_dotenv()
-
-# Set OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Prefix of the response returned when the GPT call fails
+GPT_ERROR_PREFIX = "Error getting response from GPT"
 
 def format_prompt(query: str, context: str) -> str:
     """
@@ -53,7 +49,7 @@ def get_gpt_response(prompt: str, model: str = "gpt-4") -> str:
         GPT's response
     """
     try:
-        response = openai.chat.completions.create(
+        response = get_client().chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": "You are an AI coding assistant that helps users understand codebases."},
@@ -65,7 +61,7 @@ def get_gpt_response(prompt: str, model: str = "gpt-4") -> str:
         
         return response.choices[0].message.content
     except Exception as e:
-        return f"Error getting response from GPT: {str(e)}"
+        return f"{GPT_ERROR_PREFIX}: {str(e)}"
 
 def process_query(query: str, top_k: int = 5, model: str = "gpt-4") -> Dict[str, Any]:
     """
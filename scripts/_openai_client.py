@@ -0,0 +1,36 @@
+"""
+Shared OpenAI client configuration.
+"""
+
+import functools
+import openai
+from dotenv import load_dotenv
+
+# Load environment variables once for every module that talks to OpenAI
+load_dotenv()
+
+@functools.lru_cache(maxsize=None)
+def get_client() -> openai.OpenAI:
+    """
+    Get the process-wide OpenAI client.
+    
+    The client is created on first use, so importing this module does not
+    require OPENAI_API_KEY to be set. Reusing one client keeps its HTTP
+    connections alive across requests.
+    
+    Returns:
+        OpenAI client
+    """
+    return openai.OpenAI()
+
+def new_async_client() -> openai.AsyncOpenAI:
+    """
+    Create an async OpenAI client.
+    
+    Async clients are tied to the event loop they are first used on, so a
+    new one is created for each asyncio.run instead of being shared.
+    
+    Returns:
+        Async OpenAI client
+    """
+    return openai.AsyncOpenAI()
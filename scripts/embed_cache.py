@@ -0,0 +1,112 @@
+"""
+Persistent on-disk cache for embedding vectors.
+"""
+
+import os
+import hashlib
+import sqlite3
+from contextlib import closing
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Default location of the cache database, overridable with EMBED_CACHE_PATH
+DEFAULT_CACHE_PATH = "data/embed_cache.sqlite"
+
+# Number of keys looked up per SELECT, kept below SQLite's variable limit
+_LOOKUP_BATCH_SIZE = 500
+
+def cache_key(model: str, text: str) -> bytes:
+    """
+    Compute the cache key for a (model, text) pair.
+    
+    Args:
+        model: Embedding model name
+        text: Text that was embedded
+    
+    Returns:
+        SHA-256 digest of the model and text
+    """
+    return hashlib.sha256((model + "\0" + text).encode("utf-8")).digest()
+
+class EmbeddingCache:
+    """SQLite-backed mapping from (model, text) to float32 embedding vectors."""
+    
+    def __init__(self, cache_path: Optional[str] = None):
+        """
+        Open the cache, creating the database file if needed.
+        
+        Args:
+            cache_path: Path to the SQLite database file. Defaults to the
+                EMBED_CACHE_PATH environment variable (read when the cache is
+                opened, so values from .env apply) or DEFAULT_CACHE_PATH.
+        """
+        if cache_path is None:
+            cache_path = os.getenv("EMBED_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.cache_path = cache_path
+        cache_dir = os.path.dirname(cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB)")
+    
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.cache_path)
+    
+    def get_many(self, model: str, texts: Sequence[str]) -> Dict[int, np.ndarray]:
+        """
+        Look up cached embeddings for a list of texts.
+        
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+        
+        Returns:
+            Dictionary mapping position in texts to its cached vector
+        """
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        
+        with closing(self._connect()) as conn, conn:
+            for start in range(0, len(keys), _LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + _LOOKUP_BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                )
+                for key, vec in rows:
+                    found[key] = np.frombuffer(vec, dtype=np.float32)
+        
+        return {i: found[key] for i, key in enumerate(keys) if key in found}
+    
+    def find_uncached_texts(self, model: str, texts: Sequence[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Split texts into those already cached and those that need embedding.
+        
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+        
+        Returns:
+            Tuple of (cached vectors keyed by position, positions of uncached texts)
+        """
+        cached = self.get_many(model, texts)
+        uncached = [i for i in range(len(texts)) if i not in cached]
+        return cached, uncached
+    
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        """
+        Store embeddings for a list of texts.
+        
+        Args:
+            model: Embedding model name
+            texts: Texts that were embedded
+            vectors: Embedding vectors, in the same order as texts
+        """
+        rows = [
+            (cache_key(model, text), np.asarray(vec, dtype=np.float32).tobytes())
+            for text, vec in zip(texts, vectors)
+        ]
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", rows)
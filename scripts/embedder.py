@@ -3,47 +3,149 @@ Code embedding and storage in vector database.
 """
 
 import os
-import json
+import sys
+import asyncio
 import numpy as np
 import faiss
+import orjson
+import pyarrow as pa
+import math
 from typing import List, Dict, Any, Tuple
 import openai
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Add the parent directory to the path so we can import from scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.embed_cache import EmbeddingCache
+from scripts._openai_client import new_async_client
 
-# Set OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Model used for both code chunks and queries
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Maximum number of texts sent in a single embeddings request
+EMBEDDING_BATCH_SIZE = 256
+
+# Maximum number of embeddings requests in flight at once
+EMBEDDING_CONCURRENCY = 8
+
+# Vector counts at which create_faiss_index switches to a coarser index type
+FLAT_INDEX_MAX_VECTORS = 10_000
+IVF_FLAT_INDEX_MAX_VECTORS = 1_000_000
+
+# HNSW graph parameters: neighbours per node and build-time search depth
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+
+# Retry settings for rate-limited requests
+EMBEDDING_MAX_RETRIES = 6
+EMBEDDING_BACKOFF_BASE = 1.0
+
+async def _create_embeddings(client: openai.AsyncOpenAI, texts: List[str]) -> np.ndarray:
+    """
+    Embed a list of texts, halving the batch when the request is too large.
+    
+    Rate-limited requests are retried with exponential backoff.
+    
+    Args:
+        client: Async OpenAI client
+        texts: List of texts to embed
+        
+    Returns:
+        float32 array of shape (len(texts), dimension), in the same order as texts
+    """
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        try:
+            response = await client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=texts
+            )
+            break
+        except openai.RateLimitError:
+            if attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            await asyncio.sleep(EMBEDDING_BACKOFF_BASE * 2 ** attempt)
+        except openai.APIStatusError as e:
+            # 400/413 means the payload exceeded the per-request token limit
+            if e.status_code not in (400, 413) or len(texts) == 1:
+                raise
+            middle = len(texts) // 2
+            first = await _create_embeddings(client, texts[:middle])
+            second = await _create_embeddings(client, texts[middle:])
+            return np.concatenate([first, second])
+    
+    # The API does not guarantee ordering, so sort by input index
+    return np.asarray([d.embedding for d in sorted(response.data, key=lambda d: d.index)], dtype=np.float32)
+
+async def _embed_batches(texts: List[str]) -> np.ndarray:
+    """
+    Embed texts in batches, keeping up to EMBEDDING_CONCURRENCY requests in flight.
+    
+    The output array is allocated once the first batch reveals the embedding
+    dimension, and each batch is written straight into its rows.
+    
+    Args:
+        texts: List of texts to embed
+        
+    Returns:
+        float32 array of shape (len(texts), dimension), in the same order as texts
+    """
+    client = new_async_client()
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    
+    embeddings = None
+    
+    async def embed_batch(start: int, batch: List[str]):
+        nonlocal embeddings
+        async with semaphore:
+            batch_embeddings = await _create_embeddings(client, batch)
+        if embeddings is None:
+            embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=np.float32)
+        embeddings[start:start + len(batch)] = batch_embeddings
+    
+    try:
+        await asyncio.gather(*(
+            embed_batch(start, texts[start:start + EMBEDDING_BATCH_SIZE])
+            for start in range(0, len(texts), EMBEDDING_BATCH_SIZE)
+        ))
+    finally:
+        await client.close()
+    
+    return embeddings
+
+def chunk_to_text(chunk: Dict[str, Any]) -> str:
+    """
+    Build the text that is embedded for a code chunk.
+    
+    The docstring is prepended to the code for better semantic understanding.
+    
+    Args:
+        chunk: Code chunk with 'content' and optional 'docstring' fields
+        
+    Returns:
+        Text to embed
+    """
+    if chunk.get("docstring"):
+        return f"{chunk['docstring']}\n\n{chunk['content']}"
+    return chunk["content"]
 
 def embed_chunks(chunks: List[Dict[str, Any]]) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
     """
     Convert code chunks into embeddings using OpenAI's API.
     
+    Chunks are sent in batches of EMBEDDING_BATCH_SIZE, with up to
+    EMBEDDING_CONCURRENCY batches in flight at once. Chunks whose text is
+    already in the embedding cache are not re-sent to the API.
+    
     Args:
         chunks: List of code chunks with 'content' and 'docstring' fields
         
     Returns:
         Tuple of (embeddings array, metadata list)
     """
-    embeddings = []
+    texts = []
     metadata = []
     
     for i, chunk in enumerate(chunks):
-        # Combine content and docstring for better semantic understanding
-        text_to_embed = chunk["content"]
-        if chunk.get("docstring"):
-            text_to_embed = f"{chunk['docstring']}\n\n{text_to_embed}"
-        
-        # Get embedding from OpenAI
-        response = openai.embeddings.create(
-            model="text-embedding-3-small",
-            input=text_to_embed
-        )
-        
-        # Extract embedding vector
-        embedding = response.data[0].embedding
-        embeddings.append(embedding)
+        texts.append(chunk_to_text(chunk))
         
         # Store metadata for retrieval
         chunk_metadata = {
@@ -57,48 +159,211 @@ def embed_chunks(chunks: List[Dict[str, Any]]) -> Tuple[np.ndarray, List[Dict[st
         }
         metadata.append(chunk_metadata)
     
-    return np.array(embeddings, dtype=np.float32), metadata
+    # Reuse cached embeddings and only send the remaining texts to OpenAI
+    cache = EmbeddingCache()
+    cached, uncached = cache.find_uncached_texts(EMBEDDING_MODEL, texts)
+    
+    new_embeddings = np.empty((0, 0), dtype=np.float32)
+    if uncached:
+        uncached_texts = [texts[i] for i in uncached]
+        new_embeddings = asyncio.run(_embed_batches(uncached_texts))
+        cache.put_many(EMBEDDING_MODEL, uncached_texts, new_embeddings)
+    
+    if not cached:
+        # Nothing cached, so the API result is already the full matrix
+        return new_embeddings, metadata
+    
+    # Fill a single contiguous matrix from cached and newly embedded rows
+    dimension = len(next(iter(cached.values())))
+    embeddings = np.empty((len(texts), dimension), dtype=np.float32)
+    for i, vector in cached.items():
+        embeddings[i] = vector
+    if uncached:
+        embeddings[uncached] = new_embeddings
+    
+    return embeddings, metadata
 
-def store_embeddings(embeddings: np.ndarray, metadata: List[Dict[str, Any]], index_path: str = "data/index"):
+def store_embeddings(embeddings: np.ndarray, metadata: List[Dict[str, Any]], index_path: str = "data/index",
+                     index_kind: str = "auto"):
     """
     Store embeddings and metadata for later retrieval.
     
+    Embeddings are L2-normalized in place so the inner-product index
+    ranks by cosine similarity. A float16 copy of the normalized vectors is
+    saved alongside the index so rebuild_index can recreate it, e.g. with a
+    different index_kind, without re-embedding.
+    
     Args:
         embeddings: numpy array of embeddings
         metadata: list of metadata dictionaries
         index_path: path to store the index files
+        index_kind: FAISS index type, see create_faiss_index
     """
     # Create directory if it doesn't exist
     os.makedirs(index_path, exist_ok=True)
     
-    # Save metadata
-    metadata_path = os.path.join(index_path, "metadata.json")
-    with open(metadata_path, "w") as f:
-        json.dump(metadata, f)
+    # Save metadata as an Arrow IPC file so the retriever can memory-map it.
+    # Write to a temporary file first: replacing the file in place would
+    # invalidate any existing memory maps of the old one.
+    metadata_path = os.path.join(index_path, "metadata.arrow")
+    tmp_metadata_path = metadata_path + ".tmp"
+    table = pa.Table.from_pylist(metadata)
+    with pa.OSFile(tmp_metadata_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_metadata_path, metadata_path)
+    
+    # Normalize so inner product equals cosine similarity
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    faiss.normalize_L2(embeddings)
+    
+    # Save half-precision vectors; OpenAI embeddings lose negligible recall in fp16
+    vectors_path = os.path.join(index_path, "vectors.fp16.npy")
+    np.save(vectors_path, embeddings.astype(np.float16))
     
     # Create and save FAISS index
-    index = create_faiss_index(embeddings)
+    index = create_faiss_index(embeddings, kind=index_kind)
     index_path = os.path.join(index_path, "code_index.faiss")
-    faiss.write_index(index, index_path)
+    _write_index(index, index_path)
     
     print(f"Stored {len(embeddings)} embeddings in {index_path}")
     print(f"Metadata saved to {metadata_path}")
+    print(f"Vectors saved to {vectors_path}")
+
+def _write_index(index: faiss.Index, index_file: str):
+    """
+    Write a FAISS index, replacing any existing file atomically.
+    
+    The retriever may have the old file memory-mapped, so it must not be
+    overwritten in place.
+    
+    Args:
+        index: FAISS index
+        index_file: path of the index file
+    """
+    tmp_index_file = index_file + ".tmp"
+    faiss.write_index(index, tmp_index_file)
+    os.replace(tmp_index_file, index_file)
+
+def load_vectors(index_path: str = "data/index") -> np.ndarray:
+    """
+    Load the normalized vectors saved by store_embeddings.
+    
+    Args:
+        index_path: path to the directory containing the index files
+        
+    Returns:
+        float32 array of shape (num_vectors, dimension)
+    """
+    vectors_path = os.path.join(index_path, "vectors.fp16.npy")
+    if not os.path.exists(vectors_path):
+        raise FileNotFoundError(f"Vectors file not found: {vectors_path}")
+    
+    # Expand to float32 for FAISS and undo the small fp16 rounding in the norms
+    vectors = np.load(vectors_path).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    
+    return vectors
 
-def create_faiss_index(embeddings: np.ndarray) -> faiss.Index:
+def rebuild_index(index_path: str = "data/index", index_kind: str = "auto"):
+    """
+    Rebuild the FAISS index from saved vectors, without calling the API.
+    
+    Args:
+        index_path: path to the directory containing the index files
+        index_kind: FAISS index type, see create_faiss_index
+    """
+    vectors = load_vectors(index_path)
+    index = create_faiss_index(vectors, kind=index_kind)
+    index_file = os.path.join(index_path, "code_index.faiss")
+    _write_index(index, index_file)
+    
+    print(f"Rebuilt {index_file} from {len(vectors)} saved vectors")
+
+def _pq_subquantizers(dimension: int) -> int:
+    """
+    Pick the number of PQ sub-quantizers for a given dimension.
+    
+    FAISS requires the dimension to be a multiple of the number of
+    sub-quantizers, so take the largest divisor not above min(64, d // 4).
+    
+    Args:
+        dimension: embedding dimension
+        
+    Returns:
+        Number of sub-quantizers
+    """
+    m = max(1, min(64, dimension // 4))
+    while dimension % m:
+        m -= 1
+    return m
+
+def create_faiss_index(embeddings: np.ndarray, kind: str = "auto") -> faiss.Index:
     """
     Create a FAISS index from embeddings.
     
+    With kind="auto" the index type is chosen from the number of vectors:
+    exhaustive "flat" search below FLAT_INDEX_MAX_VECTORS, "ivf_flat" below
+    IVF_FLAT_INDEX_MAX_VECTORS and compressed "ivf_pq" above that.
+    "flat_fp16" is an exhaustive index that stores vectors as float16,
+    halving memory and bandwidth compared to "flat". IVF indexes store a
+    default nprobe which can be overridden at query time with the
+    FAISS_NPROBE environment variable.
+    
+    "hnsw" builds an HNSW graph, which needs no training and gives fast
+    top-k search at the cost of more RAM than IVF-PQ; "hnsw_fp16" stores
+    the graph's vectors as float16. Their query-time knob is efSearch,
+    set with the EF_SEARCH environment variable.
+    
+    All index types score by inner product, so embeddings should be
+    L2-normalized first to get cosine similarity.
+    
     Args:
         embeddings: numpy array of embeddings
+        kind: one of "auto", "flat", "flat_fp16", "ivf_flat", "ivf_pq",
+            "hnsw" or "hnsw_fp16"
         
     Returns:
         FAISS index
     """
-    # Get embedding dimension
-    dimension = embeddings.shape[1]
+    # Get number of vectors and embedding dimension
+    num_vectors, dimension = embeddings.shape
+    
+    if kind == "auto":
+        if num_vectors < FLAT_INDEX_MAX_VECTORS:
+            kind = "flat"
+        elif num_vectors < IVF_FLAT_INDEX_MAX_VECTORS:
+            kind = "ivf_flat"
+        else:
+            kind = "ivf_pq"
     
     # Create index
-    index = faiss.IndexFlatL2(dimension)
+    if kind == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif kind == "flat_fp16":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif kind in ("ivf_flat", "ivf_pq"):
+        nlist = max(1, int(4 * math.sqrt(num_vectors)))
+        quantizer = faiss.IndexFlatIP(dimension)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), 8,
+                                     faiss.METRIC_INNER_PRODUCT)
+        
+        # IVF indexes learn their coarse centroids before vectors can be added
+        index.train(embeddings)
+        index.nprobe = max(1, nlist // 64)
+    elif kind in ("hnsw", "hnsw_fp16"):
+        if kind == "hnsw":
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_fp16, HNSW_M,
+                                      faiss.METRIC_INNER_PRODUCT)
+            index.train(embeddings)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        raise ValueError(f"Unknown FAISS index kind: {kind}")
     
     # Add vectors to the index
     index.add(embeddings)
@@ -118,8 +383,8 @@ def load_code_chunks(chunks_path: str = "code_chunks.json") -> List[Dict[str, An
     if not os.path.exists(chunks_path):
         raise FileNotFoundError(f"Code chunks file not found: {chunks_path}")
     
-    with open(chunks_path, "r") as f:
-        chunks = json.load(f)
+    with open(chunks_path, "rb") as f:
+        chunks = orjson.loads(f.read())
     
     return chunks
 
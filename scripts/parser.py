@@ -4,12 +4,25 @@ Code parser for extracting files, classes, and functions from the codebase.
 
 import os
 import ast
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Any, Tuple
 
+# Directories that never contain project source worth indexing
+EXCLUDED_DIRS = {
+    '__pycache__', 'node_modules', 'venv', 'dist', 'build',
+    '.git', '.venv', '.mypy_cache', '.pytest_cache'
+}
+
+# Below this many files, parsing in-process is faster than starting workers
+PARALLEL_MIN_FILES = 32
+
 def parse_codebase(codebase_path):
     """
     Parse the entire codebase and extract files, classes, and functions.
     
+    Python files are parsed in parallel across CPU cores once there are at
+    least PARALLEL_MIN_FILES of them.
+    
     Args:
         codebase_path: Path to the codebase root directory
         
@@ -26,45 +39,49 @@ def parse_codebase(codebase_path):
         "code_chunks": []
     }
     
-    # Extract all files
-    files = extract_files(codebase_path)
-    result["files"] = files
+    # Extract all Python files
+    py_files = extract_files(codebase_path)
+    result["files"] = py_files
     
     # For each file, extract classes and functions
-    for file_path in files:
-        if file_path.endswith('.py'):  # Only process Python files
-            classes = extract_classes(file_path)
-            functions = extract_functions(file_path)
-            
-            result["classes"].extend(classes)
-            result["functions"].extend(functions)
-            
-            # Generate code chunks for embeddings
-            code_chunks = generate_code_chunks(file_path, classes, functions)
-            result["code_chunks"].extend(code_chunks)
+    if len(py_files) >= PARALLEL_MIN_FILES:
+        with ProcessPoolExecutor() as executor:
+            parsed = list(executor.map(parse_file, py_files, chunksize=16))
+    else:
+        parsed = [parse_file(file_path) for file_path in py_files]
+    
+    for file_path, (classes, functions) in zip(py_files, parsed):
+        result["classes"].extend(classes)
+        result["functions"].extend(functions)
+        
+        # Generate code chunks for embeddings
+        code_chunks = generate_code_chunks(file_path, classes, functions)
+        result["code_chunks"].extend(code_chunks)
     
     return result
 
 def extract_files(directory):
     """
-    Extract all files from a directory recursively.
+    Extract all Python files from a directory recursively.
+    
+    Hidden directories and those in EXCLUDED_DIRS are pruned during the
+    walk, so their contents are never listed.
     
     Args:
         directory: Path to the directory
         
     Returns:
-        List of file paths
+        List of Python file paths
     """
     files = []
     
-    for root, _, filenames in os.walk(directory):
+    for root, dirs, filenames in os.walk(directory):
+        # Skip hidden and excluded directories (in place, so os.walk doesn't descend)
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in EXCLUDED_DIRS]
+        
         for filename in filenames:
-            # Skip hidden files and directories
-            if filename.startswith('.'):
-                continue
-                
-            # Skip __pycache__ directories
-            if '__pycache__' in root:
+            # Skip hidden files and anything that isn't Python
+            if filename.startswith('.') or not filename.endswith('.py'):
                 continue
                 
             file_path = os.path.join(root, filename)
@@ -100,15 +117,19 @@ def get_source_and_docstring(node, source_lines):
     
     return source_code, docstring
 
-def extract_classes(file_path):
+def parse_file(file_path):
     """
-    Extract classes from a Python file.
+    Extract top-level classes and functions from a single Python file.
+    
+    The file is read and parsed once, and only the module body is visited:
+    classes and functions defined at the top level, plus the methods
+    defined directly in each class.
     
     Args:
         file_path: Path to the Python file
         
     Returns:
-        List of dictionaries containing class information
+        Tuple of (classes, functions), each a list of dictionaries
     """
     try:
         with open(file_path, 'r', encoding='utf-8') as file:
@@ -117,8 +138,9 @@ def extract_classes(file_path):
             
         tree = ast.parse(content)
         classes = []
+        functions = []
         
-        for node in ast.walk(tree):
+        for node in tree.body:
             if isinstance(node, ast.ClassDef):
                 source_code, docstring = get_source_and_docstring(node, source_lines)
                 
@@ -133,7 +155,7 @@ def extract_classes(file_path):
                 
                 # Extract methods
                 for child in node.body:
-                    if isinstance(child, ast.FunctionDef):
+                    if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
                         method_source, method_docstring = get_source_and_docstring(child, source_lines)
                         
                         method_info = {
@@ -145,33 +167,8 @@ def extract_classes(file_path):
                         class_info["methods"].append(method_info)
                 
                 classes.append(class_info)
-        
-        return classes
-    except Exception as e:
-        print(f"Error parsing file {file_path}: {e}")
-        return []
-
-def extract_functions(file_path):
-    """
-    Extract functions from a Python file.
-    
-    Args:
-        file_path: Path to the Python file
-        
-    Returns:
-        List of dictionaries containing function information
-    """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.read()
-            source_lines = content.split('\n')
             
-        tree = ast.parse(content)
-        functions = []
-        
-        for node in ast.walk(tree):
-            # Only extract top-level functions (not methods inside classes)
-            if isinstance(node, ast.FunctionDef) and not isinstance(node.parent, ast.ClassDef):
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
                 source_code, docstring = get_source_and_docstring(node, source_lines)
                 
                 function_info = {
@@ -183,10 +180,10 @@ def extract_functions(file_path):
                 }
                 functions.append(function_info)
         
-        return functions
+        return classes, functions
     except Exception as e:
         print(f"Error parsing file {file_path}: {e}")
-        return []
+        return [], []
 
 def generate_code_chunks(file_path, classes, functions):
     """
@@ -249,7 +246,7 @@ def generate_code_chunks(file_path, classes, functions):
 if __name__ == "__main__":
     # Example usage
     import sys
-    import json
+    import orjson
     
     if len(sys.argv) > 1:
         codebase_path = sys.argv[1]
@@ -278,7 +275,7 @@ if __name__ == "__main__":
     
     # Save code chunks to a JSON file
     output_file = "code_chunks.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(result['code_chunks'], f, indent=2)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(result['code_chunks'], option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE))
     
     print(f"\nCode chunks saved to {output_file}") 
\ No newline at end of file
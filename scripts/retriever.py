@@ -3,100 +3,288 @@ Retrieves relevant code chunks from the vector database.
 """
 
 import os
-import json
+import sys
+import functools
+import threading
 import numpy as np
 import faiss
-from typing import List, Dict, Any, Tuple
-import openai
-from dotenv import load_dotenv
+import pyarrow as pa
+from typing import List, Dict, Any, Tuple, Union
 
-# Load environment variables
-load_dotenv()
+# Add the parent directory to the path so we can import from scripts
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.embed_cache import EmbeddingCache
+from scripts.embedder import EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE
+from scripts._openai_client import get_client
 
-# Set OpenAI API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Let FAISS spread search over all cores (override with FAISS_NUM_THREADS)
+faiss.omp_set_num_threads(int(os.getenv("FAISS_NUM_THREADS", os.cpu_count() or 4)))
 
-def load_index_and_metadata(index_path: str = "data/index") -> Tuple[faiss.Index, List[Dict[str, Any]]]:
+# Loaded indexes keyed by index directory, see load_index_and_metadata
+_INDEX_CACHE: Dict[str, Tuple[Tuple[float, float], faiss.Index, pa.Table]] = {}
+_INDEX_CACHE_LOCK = threading.Lock()
+
+def configure_search_params(index: faiss.Index):
+    """
+    Apply query-time search parameters from the environment to an index.
+    
+    FAISS_NPROBE sets the number of IVF lists scanned per query and
+    EF_SEARCH the HNSW search depth (default 64); higher values trade speed
+    for recall. FAISS_PRECOMPUTE=0 frees the IVF-PQ
+    precomputed distance table, which FAISS rebuilds on every load for L2
+    quantizers and which can take more RAM than the index itself. Other
+    index types are unchanged.
+    
+    Args:
+        index: FAISS index loaded from disk
+    """
+    hnsw_index = faiss.downcast_index(index)
+    if isinstance(hnsw_index, faiss.IndexHNSW):
+        hnsw_index.hnsw.efSearch = int(os.getenv("EF_SEARCH", "64"))
+        return
+    
+    try:
+        ivf_index = faiss.downcast_index(faiss.extract_index_ivf(index))
+    except RuntimeError:
+        # Not an IVF index, nothing to tune
+        return
+    
+    nprobe = os.getenv("FAISS_NPROBE")
+    if nprobe:
+        ivf_index.nprobe = int(nprobe)
+    
+    if os.getenv("FAISS_PRECOMPUTE") == "0" and isinstance(ivf_index, faiss.IndexIVFPQ):
+        ivf_index.use_precomputed_table = -1
+        ivf_index.precomputed_table.resize(0)
+
+def _read_index(index_file: str) -> faiss.Index:
+    """
+    Read a FAISS index, memory-mapping it when the index type allows.
+    
+    IO_FLAG_MMAP_IFC maps the vector storage of flat and IVF indexes, while
+    IO_FLAG_MMAP (available in older FAISS releases too) maps IVF lists.
+    The OS page cache then loads the index lazily instead of copying the
+    whole file into RAM. Indexes that cannot be mapped are read normally.
+    
+    Args:
+        index_file: Path to the FAISS index file
+        
+    Returns:
+        FAISS index
+    """
+    mmap_flags = [getattr(faiss, "IO_FLAG_MMAP_IFC", None), faiss.IO_FLAG_MMAP]
+    for flag in mmap_flags:
+        if flag is None:
+            continue
+        try:
+            return faiss.read_index(index_file, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # This index type can't be mapped with this flag
+            continue
+    
+    return faiss.read_index(index_file)
+
+def load_index_and_metadata(index_path: str = "data/index") -> Tuple[faiss.Index, pa.Table]:
     """
     Load the FAISS index and metadata from disk.
     
+    Loaded indexes are cached per directory and reused until either file's
+    modification time changes, so repeated queries skip the disk read.
+    Metadata is memory-mapped from an Arrow IPC file, so rows are only
+    read from disk when they are accessed (see get_metadata_row).
+    
     Args:
         index_path: Path to the directory containing the index and metadata
         
     Returns:
-        Tuple of (FAISS index, metadata list)
+        Tuple of (FAISS index, metadata table)
     """
-    # Load FAISS index
     index_file = os.path.join(index_path, "code_index.faiss")
     if not os.path.exists(index_file):
         raise FileNotFoundError(f"FAISS index not found: {index_file}")
     
-    index = faiss.read_index(index_file)
-    
-    # Load metadata
-    metadata_file = os.path.join(index_path, "metadata.json")
+    metadata_file = os.path.join(index_path, "metadata.arrow")
     if not os.path.exists(metadata_file):
         raise FileNotFoundError(f"Metadata file not found: {metadata_file}")
     
-    with open(metadata_file, "r") as f:
-        metadata = json.load(f)
+    cache_key = os.path.abspath(index_path)
+    mtimes = (os.path.getmtime(index_file), os.path.getmtime(metadata_file))
+    
+    with _INDEX_CACHE_LOCK:
+        cached = _INDEX_CACHE.get(cache_key)
+        if cached is not None and cached[0] == mtimes:
+            return cached[1], cached[2]
+        
+        # Load FAISS index
+        index = _read_index(index_file)
+        configure_search_params(index)
+        
+        # Memory-map metadata
+        source = pa.memory_map(metadata_file, "r")
+        metadata = pa.ipc.open_file(source).read_all()
+        
+        _INDEX_CACHE[cache_key] = (mtimes, index, metadata)
     
     return index, metadata
 
-def embed_query(query: str) -> np.ndarray:
+def get_metadata_row(metadata: pa.Table, idx: int) -> Dict[str, Any]:
     """
-    Embed a user query using the same model as the code chunks.
+    Materialize a single metadata row as a dictionary.
+    
+    Args:
+        metadata: Metadata table from load_index_and_metadata
+        idx: Row index
+        
+    Returns:
+        Dictionary of column name to value
+    """
+    return {name: metadata.column(name)[idx].as_py() for name in metadata.column_names}
+
+@functools.lru_cache(maxsize=2048)
+def _embed_query_cached(query: str) -> np.ndarray:
+    """
+    Embed a query, checking the on-disk embedding cache first.
+    
+    Results are also kept in memory, so the returned array is read-only.
     
     Args:
         query: User's question
         
     Returns:
-        Embedding vector as numpy array
+        Read-only embedding vector as numpy array
     """
-    # Get embedding from OpenAI
-    response = openai.embeddings.create(
-        model="text-embedding-3-small",
-        input=query
-    )
+    cache = EmbeddingCache()
+    cached = cache.get_many(EMBEDDING_MODEL, [query])
     
-    # Extract embedding vector and convert to numpy array
-    embedding = np.array(response.data[0].embedding, dtype=np.float32)
+    if 0 in cached:
+        embedding = cached[0]
+    else:
+        # Get embedding from OpenAI
+        response = get_client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=query
+        )
+        
+        # Extract embedding vector and convert to numpy array
+        embedding = np.array(response.data[0].embedding, dtype=np.float32)
+        cache.put_many(EMBEDDING_MODEL, [query], [embedding])
     
+    embedding.setflags(write=False)
     return embedding
 
-def search_similar_chunks(query: str, top_k: int = 5, index_path: str = "data/index") -> List[Dict[str, Any]]:
+def _embed_queries(queries: List[str]) -> np.ndarray:
     """
-    Search for code chunks similar to the query.
+    Embed several queries, sending uncached ones in batched API calls.
     
     Args:
-        query: User's question
-        top_k: Number of similar chunks to retrieve
+        queries: List of user questions
+        
+    Returns:
+        float32 array of shape (len(queries), dimension); (0, 0) when
+        queries is empty
+    """
+    if not queries:
+        return np.empty((0, 0), dtype=np.float32)
+    
+    cache = EmbeddingCache()
+    cached, uncached = cache.find_uncached_texts(EMBEDDING_MODEL, queries)
+    
+    new_embeddings = {}
+    for start in range(0, len(uncached), EMBEDDING_BATCH_SIZE):
+        batch_indices = uncached[start:start + EMBEDDING_BATCH_SIZE]
+        batch_queries = [queries[i] for i in batch_indices]
+        response = get_client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=batch_queries
+        )
+        vectors = [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        cache.put_many(EMBEDDING_MODEL, batch_queries, vectors)
+        new_embeddings.update(zip(batch_indices, vectors))
+    
+    return np.array(
+        [cached[i] if i in cached else new_embeddings[i] for i in range(len(queries))],
+        dtype=np.float32
+    )
+
+def embed_query(query: Union[str, List[str]]) -> np.ndarray:
+    """
+    Embed a user query using the same model as the code chunks.
+    
+    Args:
+        query: User's question, or a list of questions to embed together
+        
+    Returns:
+        Embedding vector as numpy array, or a (num_queries, dimension)
+        array when a list is given
+    """
+    if isinstance(query, list):
+        return _embed_queries(query)
+    
+    return _embed_query_cached(query).copy()
+
+def _search_embeddings(query_embeddings: np.ndarray, top_k: int, index_path: str) -> List[List[Dict[str, Any]]]:
+    """
+    Search the index with a matrix of query embeddings.
+    
+    Args:
+        query_embeddings: float32 array of shape (num_queries, dimension)
+        top_k: Number of similar chunks to retrieve per query
         index_path: Path to the directory containing the index and metadata
         
     Returns:
-        List of relevant code chunks with metadata
+        List of relevant code chunks for each query
     """
     # Load index and metadata
     index, metadata = load_index_and_metadata(index_path)
     
-    # Embed the query
-    query_embedding = embed_query(query)
+    # FAISS kernels need C-contiguous float32 input
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
     
-    # Reshape for FAISS (needs to be 2D)
-    query_embedding = query_embedding.reshape(1, -1)
+    # Normalize to match the cosine-similarity index
+    faiss.normalize_L2(query_embeddings)
     
-    # Search for similar vectors
-    distances, indices = index.search(query_embedding, top_k)
+    # Search for similar vectors for all queries at once
+    similarities, indices = index.search(query_embeddings, top_k)
     
     # Get the relevant chunks
-    relevant_chunks = []
-    for i, idx in enumerate(indices[0]):
-        if idx < len(metadata):  # Ensure index is valid
-            chunk = metadata[idx]
-            chunk["distance"] = float(distances[0][i])  # Add distance score
-            relevant_chunks.append(chunk)
-    
-    return relevant_chunks
+    results = []
+    for query_similarities, query_indices in zip(similarities, indices):
+        relevant_chunks = []
+        for similarity, idx in zip(query_similarities, query_indices):
+            if 0 <= idx < metadata.num_rows:  # Ensure index is valid (FAISS pads with -1)
+                chunk = get_metadata_row(metadata, int(idx))
+                chunk["distance"] = 1.0 - float(similarity)  # Add cosine distance score
+                relevant_chunks.append(chunk)
+        results.append(relevant_chunks)
+    
+    return results
+
+def search_similar_chunks(query: Union[str, List[str]], top_k: int = 5,
+                          index_path: str = "data/index") -> Union[List[Dict[str, Any]], List[List[Dict[str, Any]]]]:
+    """
+    Search for code chunks similar to the query.
+    
+    Passing a list of queries embeds them in one API call and searches
+    the index once with all of them.
+    
+    Args:
+        query: User's question, or a list of questions
+        top_k: Number of similar chunks to retrieve
+        index_path: Path to the directory containing the index and metadata
+        
+    Returns:
+        List of relevant code chunks with metadata, or one such list per
+        query when a list is given
+    """
+    if isinstance(query, list):
+        if not query:
+            return []
+        return _search_embeddings(embed_query(query), top_k, index_path)
+    
+    # Reshape for FAISS (needs to be 2D)
+    query_embedding = embed_query(query).reshape(1, -1)
+    
+    return _search_embeddings(query_embedding, top_k, index_path)[0]
 
 def get_context_for_query(query: str, top_k: int = 5) -> str:
     """
@@ -5,12 +5,11 @@ Streamlit UI for the AI Dev Copilot.
 import streamlit as st
 import os
 import sys
-import time
 from typing import Dict, Any
 
 # Add the parent directory to the path so we can import from gpt
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from gpt.query_engine import process_query
+from gpt.query_engine import process_query, GPT_ERROR_PREFIX
 
 # Set page config
 st.set_page_config(
@@ -62,6 +61,26 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+class QueryFailedError(Exception):
+    """Raised for failed GPT calls so st.cache_data does not store them."""
+    
+    def __init__(self, response_data: Dict[str, Any]):
+        super().__init__(response_data["response"])
+        self.response_data = response_data
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_process_query(query: str, top_k: int, model: str) -> Dict[str, Any]:
+    """
+    Process a query, reusing the result of identical recent queries.
+    
+    Answers are kept for up to an hour, so they may be stale for that long
+    after the index is rebuilt with create_index.py.
+    """
+    response_data = process_query(query, top_k=top_k, model=model)
+    if response_data["response"].startswith(GPT_ERROR_PREFIX):
+        raise QueryFailedError(response_data)
+    return response_data
+
 def display_response(response_data: Dict[str, Any]):
     """Display the response from the query engine."""
     # Display the response
@@ -125,11 +144,11 @@ def main():
     if submit_button:
         if query:
             with st.spinner("Thinking..."):
-                # Add a small delay to show the spinner
-                time.sleep(0.5)
-                
-                # Process the query
-                response_data = process_query(query, top_k=top_k, model=model)
+                # Process the query (failures are shown but not cached)
+                try:
+                    response_data = cached_process_query(query, top_k, model)
+                except QueryFailedError as e:
+                    response_data = e.response_data
                 
                 # Display the response
                 display_response(response_data)